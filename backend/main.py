@@ -1,10 +1,15 @@
 # backend/main.py
 import asyncio
 import os
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+import time
+import msgspec
+import orjson
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pymongo import MongoClient
-from pydantic import BaseModel
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from redis import asyncio as aioredis
 
 app = FastAPI()
 
@@ -19,20 +24,45 @@ app.add_middleware(
 
 # MongoDB
 MONGO_URI = os.getenv("MONGO_URI")
-client = MongoClient(MONGO_URI)
+client = AsyncIOMotorClient(
+    MONGO_URI,
+    maxPoolSize=50,
+    minPoolSize=5,
+    serverSelectionTimeoutMS=2000,
+    waitQueueTimeoutMS=500,
+)
 db = client["cricket_auction"]
 players_collection = db["players"]
+# small separate pool for full-collection scans so they can't starve writes
+slow_client = AsyncIOMotorClient(MONGO_URI, maxPoolSize=5)
+slow_db = slow_client["cricket_auction"]
+
+# Redis holds the state every worker must agree on (budgets, current bid)
+# and carries broadcasts between workers over pub/sub.
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+redis = aioredis.from_url(REDIS_URL, decode_responses=True)
+# separate connection without decoding so pub/sub frames stay raw bytes
+redis_bus = aioredis.from_url(REDIS_URL)
+BUDGETS_KEY = "auction:budgets"
+BID_KEY = "auction:bid"
+# bumped by every clear_data; sold results are tagged with the epoch they
+# happened in and anything from an older epoch is treated as wiped
+EPOCH_KEY = "auction:epoch"
+# every sale of the current epoch, as JSON, so a resyncing worker sees sales
+# that are still waiting in some worker's flush buffer
+RESULTS_LIST_PREFIX = "auction:results:"
+EVENTS_CHANNEL = "auction:events"
 
 # Player model (if you want to add via API later)
-class Player(BaseModel):
+class Player(msgspec.Struct):
     name: str
     role: str
     base_price: int
     image: str = ""
 
 # --------- Sample load (if empty) ----------
-def load_sample_players():
-    if players_collection.count_documents({}) == 0:
+async def load_sample_players():
+    if await players_collection.count_documents({}) == 0:
         sample_players = [
             {"name":"Virat Kohli","role":"Batsman","base_price":50000,"image":"https://i.ibb.co/ZdS5KpR/virat.jpg"},
             {"name":"Rohit Sharma","role":"Batsman","base_price":45000,"image":"https://i.ibb.co/xFM3W2T/rohit.jpg"},
@@ -40,169 +70,528 @@ def load_sample_players():
             {"name":"Hardik Pandya","role":"All-Rounder","base_price":42000,"image":"https://i.ibb.co/WgLwKLD/hardik.jpg"},
             {"name":"Ravindra Jadeja","role":"All-Rounder","base_price":38000,"image":"https://i.ibb.co/3WMLk9C/jadeja.jpg"}
         ]
-        players_collection.insert_many(sample_players)
-        print("Loaded sample players.")
+        # upserts, because several workers (or concurrent clear_data calls) may
+        # seed an empty collection at once and the unique name index would
+        # reject every insert but the first
+        try:
+            result = await players_collection.bulk_write(
+                [UpdateOne({"name": p["name"]}, {"$setOnInsert": p}, upsert=True) for p in sample_players],
+                ordered=False,
+            )
+        except BulkWriteError as e:
+            # a racing upsert on the same name can still surface as E11000
+            if any(err["code"] != 11000 for err in e.details["writeErrors"]):
+                raise
+            return
+        if result.upserted_count:
+            print("Loaded sample players.")
+
+async def ensure_player_name_index():
+    try:
+        await players_collection.create_index("name", unique=True)
+    except OperationFailure as e:
+        if e.code != 11000:
+            raise
+        # add_player used to accept duplicate names; keep the first copy of
+        # each so the unique index can be built
+        dupes = await players_collection.aggregate([
+            {"$group": {"_id": "$name", "ids": {"$push": "$_id"}, "n": {"$sum": 1}}},
+            {"$match": {"n": {"$gt": 1}}},
+        ]).to_list(length=None)
+        extra = [i for d in dupes for i in d["ids"][1:]]
+        await players_collection.delete_many({"_id": {"$in": extra}})
+        print(f"Removed {len(extra)} duplicate player(s) to build the unique name index.")
+        await players_collection.create_index("name", unique=True)
+
+@app.on_event("startup")
+async def startup():
+    await asyncio.gather(
+        ensure_player_name_index(),
+        db["results"].create_index("player"),
+        db["results"].create_index("epoch"),
+    )
+    # results written before epochs existed belong to the current one
+    await db["results"].update_many({"epoch": {"$exists": False}}, {"$set": {"epoch": await get_epoch()}})
+    await load_sample_players()
+    # only seed budgets that don't exist yet, so a restarting worker keeps the live auction
+    await asyncio.gather(*(redis.hsetnx(BUDGETS_KEY, t, STARTING_BUDGET) for t in TEAMS))
+    global _flush_task, _relay_task
+    _flush_task = manager._spawn(flush_results_forever())
+    # the relay loads the caches once it is subscribed; serve nothing before that
+    _relay_task = manager._spawn(relay_events())
+    await _synced.wait()
 
-load_sample_players()
+@app.on_event("shutdown")
+async def shutdown():
+    tasks = [t for t in (_flush_task, _relay_task) if t is not None]
+    for task in tasks:
+        task.cancel()
+    # let a flush interrupted mid-write put its batch back before the final one
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await flush_results()
 
 # ---------- App state ----------
-teams = {
-    "Team A": {"budget": 100000},
-    "Team B": {"budget": 100000},
-    "Team C": {"budget": 100000},
-    "Team D": {"budget": 100000},
-}
+# In-memory copies of the players/results collections. Mongo stays the
+# store of record; these are what REST reads and broadcasts are served from.
+_players_cache: list[dict] = []
+_results_cache: list[dict] = []
+# ids of the sales in _results_cache, so a sale seen by a resync isn't added twice
+_result_ids: set[str] = set()
+# encoded players_update frame, rebuilt lazily after the player list changes
+_players_update_cache: bytes | None = None
+# this worker's view of the Redis-held state, kept current from the event
+# stream so an on-connect snapshot never needs an await
+_budgets_cache: dict = {}
+_current_bid_cache: dict | None = None
+
+def _players_update_bytes() -> bytes:
+    global _players_update_cache
+    if _players_update_cache is None:
+        _players_update_cache = orjson.dumps({"type": "players_update", "players": _players_cache})
+    return _players_update_cache
+
+async def get_epoch() -> int:
+    return int(await redis.get(EPOCH_KEY) or 0)
+
+async def refresh_cache():
+    global _players_cache, _results_cache, _players_update_cache, _result_ids
+    _players_update_cache = None
+    epoch = await get_epoch()
+    _players_cache, stored, listed = await asyncio.gather(
+        slow_db["players"].find({}, {"_id": 0}, batch_size=1000).to_list(length=None),
+        slow_db["results"].find({"epoch": epoch}, {"epoch": 0}, batch_size=1000).to_list(length=None),
+        redis.lrange(f"{RESULTS_LIST_PREFIX}{epoch}", 0, -1),
+    )
+    # the Redis list has every sale of the epoch, flushed or not; Mongo adds
+    # only what predates the list
+    listed = [orjson.loads(r) for r in listed]
+    _result_ids = {r["_id"] for r in listed}
+    older = [r for r in stored if r["_id"] not in _result_ids]
+    _result_ids.update(str(r["_id"]) for r in older)
+    # and this worker's own unflushed sales, in case the list lost any
+    pending = [r for r in _pending_results if r["epoch"] == epoch and r["_id"] not in _result_ids]
+    _result_ids.update(r["_id"] for r in pending)
+    _results_cache = [{k: v for k, v in r.items() if k not in ("_id", "epoch")}
+                      for r in older + listed + pending]
 
-current_bid = {"player": None, "highest_bid": 0, "team": None, "is_active": False}
+async def resync():
+    global _budgets_cache, _current_bid_cache
+    await refresh_cache()
+    _budgets_cache, _current_bid_cache = await asyncio.gather(get_teams(), get_current_bid())
+
+TEAMS = ("Team A", "Team B", "Team C", "Team D")
+STARTING_BUDGET = 100000
+
+async def get_teams() -> dict:
+    budgets = await redis.hmget(BUDGETS_KEY, TEAMS)
+    return {t: {"budget": int(b or 0)} for t, b in zip(TEAMS, budgets)}
+
+async def get_current_bid() -> dict | None:
+    bid = await redis.hgetall(BID_KEY)
+    if bid.get("is_active") != "1":
+        return None
+    return {"player": bid["player"], "highest_bid": int(bid["highest_bid"]), "team": bid["team"] or None, "is_active": True}
+
+# Bid state lives in the BID_KEY hash (team is "" until someone bids). Every
+# change to it runs as one Lua script that also PUBLISHes the matching event,
+# so state changes and broadcasts share a single order across all workers.
+# ARGV[1] is always the events channel.
+START_BIDDING_LUA = """
+redis.call('HSET', KEYS[1], 'player', ARGV[2], 'highest_bid', 0, 'team', '', 'is_active', 1)
+redis.call('PUBLISH', ARGV[1], cjson.encode({type='start_bidding', player=ARGV[2], highest_bid=0}))
+"""
+PLACE_BID_LUA = """
+if redis.call('HGET', KEYS[1], 'is_active') ~= '1' then return {1} end
+local team = ARGV[2]
+local budget = redis.call('HGET', KEYS[2], team)
+if not budget then return {2} end
+local amount = tonumber(ARGV[3])
+if amount > tonumber(budget) then return {3} end
+if amount <= tonumber(redis.call('HGET', KEYS[1], 'highest_bid')) then return {4} end
+redis.call('HSET', KEYS[1], 'highest_bid', amount, 'team', team)
+local player = redis.call('HGET', KEYS[1], 'player')
+redis.call('PUBLISH', ARGV[1], cjson.encode({type='new_bid', player=player, highest_bid=amount, team=team}))
+return {0}
+"""
+END_BIDDING_LUA = """
+if redis.call('HGET', KEYS[1], 'is_active') ~= '1' then return false end
+local player = redis.call('HGET', KEYS[1], 'player')
+local team = redis.call('HGET', KEYS[1], 'team')
+local amount = tonumber(redis.call('HGET', KEYS[1], 'highest_bid'))
+local epoch = tonumber(redis.call('GET', KEYS[3]) or '0')
+local results_key = ARGV[2] .. epoch
+redis.call('DEL', KEYS[1])
+if team == '' then
+  redis.call('PUBLISH', ARGV[1], cjson.encode({type='end_bidding', player=player, team=cjson.null, highest_bid=0}))
+  return {player}
+end
+local remaining = redis.call('HINCRBY', KEYS[2], team, -amount)
+-- the sale id doubles as the Mongo _id, which keeps result flushes idempotent
+local id = 'e' .. epoch .. '-' .. (redis.call('LLEN', results_key) + 1)
+local result = {player=player, highest_bid=amount, team=team, is_active=false}
+redis.call('RPUSH', results_key, cjson.encode({_id=id, player=player, highest_bid=amount, team=team, is_active=false}))
+-- ARGV[3..] are the team names
+local budgets = {}
+for i = 3, #ARGV do
+  budgets[ARGV[i]] = {budget=tonumber(redis.call('HGET', KEYS[2], ARGV[i]) or '0')}
+end
+redis.call('PUBLISH', ARGV[1], cjson.encode({
+  type='player_sold',
+  event={type='end_bidding', player=player, team=team, highest_bid=amount},
+  id=id,
+  result=result,
+  budgets=budgets,
+}))
+return {player, team, amount, remaining, epoch, id}
+"""
+CLEAR_AUCTION_LUA = """
+-- KEYS[1] = budgets, KEYS[2] = epoch
+-- ARGV[2] = results list prefix, ARGV[3] = starting budget,
+-- ARGV[4] = reseeded players (JSON), ARGV[5..] = team names
+-- Bumping the epoch, resetting budgets and publishing 'cleared' happen together,
+-- so a sale settles either wholly before the clear (old epoch, wiped) or after it.
+local epoch = redis.call('INCR', KEYS[2])
+redis.call('DEL', ARGV[2] .. (epoch - 1))
+local budgets = {}
+for i = 5, #ARGV do
+  redis.call('HSET', KEYS[1], ARGV[i], ARGV[3])
+  budgets[ARGV[i]] = {budget=tonumber(ARGV[3])}
+end
+redis.call('PUBLISH', ARGV[1], '{"type":"cleared","epoch":' .. epoch .. ',"players":' .. ARGV[4] .. ',"budgets":' .. cjson.encode(budgets) .. '}')
+return epoch
+"""
+_start_bidding_script = redis.register_script(START_BIDDING_LUA)
+_place_bid_script = redis.register_script(PLACE_BID_LUA)
+_end_bidding_script = redis.register_script(END_BIDDING_LUA)
+_clear_auction_script = redis.register_script(CLEAR_AUCTION_LUA)
+
+# Sold records are already in _results_cache; the Mongo write is batched
+# off the bidding path and flushed every RESULTS_FLUSH_INTERVAL seconds.
+# Each pending doc carries its _id from the start, so retrying a doc that
+# did get written hits a duplicate key and is counted as done.
+RESULTS_FLUSH_INTERVAL = 2
+_pending_results: list[dict] = []
+_results_flush_lock = asyncio.Lock()
+_flush_task: asyncio.Task | None = None
+_relay_task: asyncio.Task | None = None
+_synced = asyncio.Event()
+RELAY_MAX_BACKOFF = 30
+
+async def flush_results():
+    async with _results_flush_lock:
+        if not _pending_results:
+            return
+        batch = _pending_results[:]
+        _pending_results.clear()
+        try:
+            # another worker may have cleared the auction since these were sold;
+            # anything that still slips through is hidden by the epoch filter
+            epoch = await get_epoch()
+            batch = [r for r in batch if r["epoch"] == epoch]
+            if not batch:
+                return
+            # copies: the driver must not touch the docs we may requeue
+            await db["results"].insert_many([dict(r) for r in batch], ordered=False)
+        except BulkWriteError as e:
+            failed = {err["index"] for err in e.details["writeErrors"] if err["code"] != 11000}
+            if failed:
+                _pending_results[:0] = [r for i, r in enumerate(batch) if i in failed]
+                raise
+        except BaseException:
+            # nothing confirmed (including cancellation mid-write); put them all
+            # back so the next flush retries - the fixed _ids make that idempotent
+            _pending_results[:0] = batch
+            raise
+
+async def flush_results_forever():
+    while True:
+        await asyncio.sleep(RESULTS_FLUSH_INTERVAL)
+        try:
+            await flush_results()
+        except Exception as e:
+            print(f"Failed to flush results: {e!r}")
 
 # -------- WebSocket broadcast manager ----------
+HEARTBEAT_INTERVAL = 25  # seconds between pings
+HEARTBEAT_TIMEOUT = 60   # close sockets that haven't ponged for this long
+PING_FRAME = b'{"type":"ping"}'
+SEND_TIMEOUT = 2         # a single frame write taking longer than this evicts the socket
+
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: list[WebSocket] = []
-        self.lock = asyncio.Lock()
+        # everything runs on the event loop, so add/discard need no lock
+        self.active_connections: set[WebSocket] = set()
+        # strong refs to background tasks so they aren't GC'd mid-flight
+        self._bg: set[asyncio.Task] = set()
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket, first_frame):
         await websocket.accept()
-        async with self.lock:
-            self.active_connections.append(websocket)
+        # each socket gets its own bounded outbox drained by a writer task,
+        # so a slow client never holds up a broadcast
+        websocket.queue = asyncio.Queue(maxsize=64)
+        # queue the snapshot and join the broadcast set with no await in
+        # between, so every later broadcast lands after the snapshot
+        websocket.queue.put_nowait(first_frame())
+        websocket.writer_task = self._spawn(self._writer(websocket))
+        # half-open connections never raise on receive; reap them by pong age
+        websocket.last_pong = time.monotonic()
+        websocket.heartbeat_task = self._spawn(self._heartbeat(websocket))
+        self.active_connections.add(websocket)
 
     async def disconnect(self, websocket: WebSocket):
-        async with self.lock:
-            if websocket in self.active_connections:
-                self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: dict):
-        # send concurrently
-        async with self.lock:
-            websockets = list(self.active_connections)
-        coros = []
-        for ws in websockets:
-            coros.append(ws.send_json(message))
-        if coros:
-            await asyncio.gather(*coros, return_exceptions=True)
+        self.active_connections.discard(websocket)
+        for name in ("writer_task", "heartbeat_task"):
+            task = getattr(websocket, name, None)
+            if task is not None and task is not asyncio.current_task():
+                task.cancel()
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._bg.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task: asyncio.Task):
+        self._bg.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Background task failed: {task.exception()!r}")
+
+    async def _writer(self, websocket: WebSocket):
+        try:
+            while True:
+                buf = await websocket.queue.get()
+                await asyncio.wait_for(websocket.send_bytes(buf), SEND_TIMEOUT)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            await self._evict(websocket)
+
+    async def _evict(self, websocket: WebSocket):
+        await self.disconnect(websocket)
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+
+    async def _heartbeat(self, websocket: WebSocket):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            if time.monotonic() - websocket.last_pong > HEARTBEAT_TIMEOUT:
+                await self._evict(websocket)
+                return
+            self._enqueue(websocket, PING_FRAME)
+
+    @staticmethod
+    def _enqueue(websocket: WebSocket, buf: bytes):
+        try:
+            websocket.queue.put_nowait(buf)
+        except asyncio.QueueFull:
+            # drop the oldest pending frame for this slow client
+            websocket.queue.get_nowait()
+            websocket.queue.put_nowait(buf)
+
+    def broadcast_raw(self, buf: bytes):
+        # queue the same encoded bytes for everyone; never awaits a peer, and
+        # _enqueue never awaits or touches active_connections, so the set can
+        # be iterated directly without a snapshot copy
+        enqueue = self._enqueue
+        for ws in self.active_connections:
+            enqueue(ws, buf)
 
 manager = ConnectionManager()
 
+def _snapshot():
+    # budgets/results/players in one frame; clients re-render all three
+    return {"budgets": _budgets_cache, "results": _results_cache, "players": _players_cache}
+
+def _connect_frame() -> bytes:
+    return orjson.dumps({"type":"snapshot", **_snapshot(), "current_bid": _current_bid_cache})
+
+# Every broadcast goes through Redis so all workers (including this one)
+# relay it to their own sockets.
+async def publish(message: dict):
+    await redis_bus.publish(EVENTS_CHANNEL, orjson.dumps(message))
+
+def _apply_event(buf: bytes) -> bytes:
+    # Roster changes travel as deltas and every worker (the sender too) applies
+    # them here, so concurrent writes on different workers can't clobber each
+    # other. Returns the frame this worker's own sockets should get.
+    global _players_cache, _results_cache, _result_ids, _players_update_cache, _budgets_cache, _current_bid_cache
+    msg = orjson.loads(buf)
+    kind = msg["type"]
+    if kind == "player_added":
+        player = msg["player"]
+        # a resync may have loaded it from Mongo already
+        if not any(p["name"] == player["name"] for p in _players_cache):
+            _players_cache.append(player)
+            _players_update_cache = None
+        return _players_update_bytes()
+    if kind == "player_sold":
+        # a resync may have picked it up from the Redis list already
+        if msg["id"] not in _result_ids:
+            _result_ids.add(msg["id"])
+            _results_cache.append(msg["result"])
+        # cjson doesn't keep key order; keep the teams in display order
+        _budgets_cache = {t: msg["budgets"][t] for t in TEAMS}
+        _current_bid_cache = None
+        return orjson.dumps({"type":"state_snapshot", "event": msg["event"], **_snapshot()})
+    if kind == "cleared":
+        _players_cache = msg["players"]
+        _results_cache = []
+        _result_ids = set()
+        _players_update_cache = None
+        _budgets_cache = {t: msg["budgets"][t] for t in TEAMS}
+        # sales this worker made after the clear are already in the new epoch
+        _pending_results[:] = [r for r in _pending_results if r["epoch"] >= msg["epoch"]]
+        return orjson.dumps({"type":"state_snapshot", "event": {"type":"clear_data"}, **_snapshot()})
+    if kind == "start_bidding":
+        _current_bid_cache = {"player": msg["player"], "highest_bid": msg["highest_bid"], "team": None, "is_active": True}
+    elif kind == "new_bid":
+        _current_bid_cache = {"player": msg["player"], "highest_bid": msg["highest_bid"], "team": msg["team"], "is_active": True}
+    elif kind == "end_bidding":
+        _current_bid_cache = None
+    return buf
+
+async def relay_events():
+    delay = 1
+    while True:
+        pubsub = redis_bus.pubsub()
+        try:
+            await pubsub.subscribe(EVENTS_CHANNEL)
+            # events published while we weren't subscribed are gone; reload
+            # from the stores and push a fresh snapshot to our own sockets
+            await resync()
+            if _synced.is_set():
+                manager.broadcast_raw(_connect_frame())
+            _synced.set()
+            delay = 1
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                try:
+                    frame = _apply_event(message["data"])
+                except Exception as e:
+                    print(f"Bad event on {EVENTS_CHANNEL}: {e!r}")
+                    continue
+                manager.broadcast_raw(frame)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Lost {EVENTS_CHANNEL} subscription: {e!r}; retrying in {delay}s")
+        finally:
+            await pubsub.reset()
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, RELAY_MAX_BACKOFF)
+
 # ---------- REST endpoints ----------
 @app.get("/")
-def home():
+async def home():
     return {"message": "Cricket Auction API (with WebSocket) running."}
 
 @app.get("/players/")
-def get_players():
-    return list(players_collection.find({}, {"_id": 0}))
-
-@app.post("/add_player/")
-def add_player(p: Player):
-    players_collection.insert_one(p.dict())
-    # broadcast players update
-    asyncio.create_task(manager.broadcast({"type": "players_update", "players": list(players_collection.find({}, {"_id": 0}))}))
+async def get_players():
+    return _players_cache
+
+# FastAPI can't see the body model since we decode it ourselves, so hand the
+# schema to OpenAPI explicitly (Player has only scalar fields, no nested refs)
+_PLAYER_SCHEMA = msgspec.json.schema_components([Player])[1]["Player"]
+
+@app.post("/add_player/", openapi_extra={
+    "requestBody": {"required": True, "content": {"application/json": {"schema": _PLAYER_SCHEMA}}},
+})
+async def add_player(request: Request):
+    # decoded with msgspec straight from the body; FastAPI/pydantic are bypassed.
+    # strict=False keeps pydantic's coercions, e.g. "50000" or 50000.0 for base_price
+    try:
+        p = msgspec.json.decode(await request.body(), type=Player, strict=False)
+    except msgspec.DecodeError as e:
+        return {"error": f"Invalid player: {e}"}
+    player = msgspec.structs.asdict(p)
+    try:
+        await players_collection.insert_one(dict(player))
+    except DuplicateKeyError:
+        return {"error": f"Player {p.name} already exists"}
+    # the cache is updated when the event comes back through the relay
+    await publish({"type":"player_added", "player": player})
     return {"message": "Player added"}
 
 @app.get("/budgets/")
-def get_budgets():
-    return teams
+async def get_budgets():
+    return await get_teams()
 
 @app.get("/results/")
-def get_results():
-    return list(db["results"].find({}, {"_id": 0}))
+async def get_results():
+    return _results_cache
 
 @app.post("/clear_data/")
-def clear_data():
-    players_collection.delete_many({})
-    db["results"].delete_many({})
-    for t in teams:
-        teams[t]["budget"] = 100000
-    load_sample_players()
-    # broadcast reset
-    asyncio.create_task(manager.broadcast({"type":"clear_data"}))
-    asyncio.create_task(manager.broadcast({"type":"players_update", "players": list(players_collection.find({}, {"_id": 0}))}))
-    asyncio.create_task(manager.broadcast({"type":"budgets_update", "budgets": teams}))
-    asyncio.create_task(manager.broadcast({"type":"results_update", "results": list(db['results'].find({}, {"_id":0}))}))
+async def clear_data():
+    await players_collection.delete_many({})
+    await load_sample_players()
+    players = await slow_db["players"].find({}, {"_id": 0}, batch_size=1000).to_list(length=None)
+    # new epoch + budget reset + broadcast of the fresh state in one atomic step
+    epoch = await _clear_auction_script(keys=[BUDGETS_KEY, EPOCH_KEY],
+                                        args=[EVENTS_CHANNEL, RESULTS_LIST_PREFIX, STARTING_BUDGET,
+                                              orjson.dumps(players).decode(), *TEAMS])
+    # From here every worker's flush drops old-epoch sales. A batch already in
+    # flight lands tagged with the old epoch, which refresh_cache never reads
+    # (this delete, or the next clear's, removes it).
+    await db["results"].delete_many({"epoch": {"$ne": epoch}})
     return {"message":"All data cleared and sample players reloaded."}
 
 # ---------- Bidding endpoints (these trigger broadcasts) ----------
 @app.post("/start_bidding/")
-def start_bidding(player_name: str):
-    global current_bid
-    current_bid = {"player": player_name, "highest_bid": 0, "team": None, "is_active": True}
-    # broadcast start
-    asyncio.create_task(manager.broadcast({
-        "type":"start_bidding",
-        "player": player_name,
-        "highest_bid": 0
-    }))
+async def start_bidding(player_name: str):
+    # sets the bid and broadcasts start in one atomic step
+    await _start_bidding_script(keys=[BID_KEY], args=[EVENTS_CHANNEL, player_name])
     return {"message": f"Bidding started for {player_name}"}
 
+BID_ERRORS = {
+    1: "No active bidding right now",
+    2: "Invalid team name",
+    3: "{team} does not have enough budget!",
+    4: "Bid must be higher than current bid",
+}
+
 @app.post("/place_bid/")
-def place_bid(team: str, amount: int):
-    global current_bid
-    if not current_bid["is_active"]:
-        return {"error":"No active bidding right now"}
-    if team not in teams:
-        return {"error":"Invalid team name"}
-    if amount > teams[team]["budget"]:
-        return {"error": f"{team} does not have enough budget!"}
-    if amount <= current_bid["highest_bid"]:
-        return {"error":"Bid must be higher than current bid"}
-
-    current_bid["highest_bid"] = amount
-    current_bid["team"] = team
-    # broadcast new bid
-    asyncio.create_task(manager.broadcast({
-        "type":"new_bid",
-        "player": current_bid["player"],
-        "highest_bid": amount,
-        "team": team
-    }))
+async def place_bid(team: str, amount: int):
+    # check-and-set (and the new_bid broadcast) runs atomically inside Redis
+    status, = await _place_bid_script(keys=[BID_KEY, BUDGETS_KEY], args=[EVENTS_CHANNEL, team, amount])
+    if status:
+        return {"error": BID_ERRORS[status].format(team=team)}
     return {"message": f"{team} placed a bid of ₹{amount}"}
 
 @app.post("/end_bidding/")
-def end_bidding():
-    global current_bid
-    if not current_bid["is_active"]:
+async def end_bidding():
+    # closes the round, charges the winning team and broadcasts the outcome
+    # in one atomic step
+    settled = await _end_bidding_script(keys=[BID_KEY, BUDGETS_KEY, EPOCH_KEY],
+                                        args=[EVENTS_CHANNEL, RESULTS_LIST_PREFIX, *TEAMS])
+    if settled is None:
         return {"message":"No active bidding to end."}
-    current_bid["is_active"] = False
-    if current_bid["team"]:
-        team = current_bid["team"]
-        amount = current_bid["highest_bid"]
-        teams[team]["budget"] -= amount
-        db["results"].insert_one(current_bid)
-        result_msg = {
-            "type":"end_bidding",
-            "player": current_bid["player"],
-            "team": team,
-            "highest_bid": amount
-        }
-        # broadcast result + budgets + results list
-        asyncio.create_task(manager.broadcast(result_msg))
-        asyncio.create_task(manager.broadcast({"type":"budgets_update", "budgets": teams}))
-        asyncio.create_task(manager.broadcast({"type":"results_update", "results": list(db['results'].find({}, {"_id":0}))}))
-        asyncio.create_task(manager.broadcast({"type":"players_update", "players": list(players_collection.find({}, {"_id": 0}))}))
-        msg = f"{current_bid['player']} sold to {team} for ₹{amount}. Remaining budget: ₹{teams[team]['budget']}"
+    if len(settled) > 1:
+        player, team, amount, remaining, epoch, sale_id = settled
+        sold = {"player": player, "highest_bid": amount, "team": team, "is_active": False}
+        _pending_results.append({**sold, "epoch": epoch, "_id": sale_id})
+        msg = f"{player} sold to {team} for ₹{amount}. Remaining budget: ₹{remaining}"
     else:
-        asyncio.create_task(manager.broadcast({"type":"end_bidding", "player": current_bid["player"], "team": None, "highest_bid": 0}))
         msg = "No bids placed."
-    # reset current_bid.player so next round can start differently if desired (we keep player stored)
-    current_bid = {"player": None, "highest_bid": 0, "team": None, "is_active": False}
     return {"message": msg}
 
 # ---------- WebSocket endpoint ----------
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+    # On new connection, send current snapshot (plus current_bid if active) as one frame
+    await manager.connect(websocket, _connect_frame)
     try:
-        # On new connection, send current snapshot
-        await websocket.send_json({"type":"players_update", "players": list(players_collection.find({}, {"_id":0}))})
-        await websocket.send_json({"type":"budgets_update", "budgets": teams})
-        await websocket.send_json({"type":"results_update", "results": list(db['results'].find({}, {"_id":0}))})
-        # optionally send current_bid if active
-        if current_bid["is_active"]:
-            await websocket.send_json({"type":"start_bidding", "player": current_bid["player"], "highest_bid": current_bid["highest_bid"]})
         while True:
-            # we do not expect client messages, but keep connection alive
+            # the only client message we act on is the heartbeat pong
             data = await websocket.receive_text()
-            # you could parse client-sent JSON and act upon it if needed
+            try:
+                msg = orjson.loads(data)
+            except orjson.JSONDecodeError:
+                continue
+            if isinstance(msg, dict) and msg.get("type") == "pong":
+                websocket.last_pong = time.monotonic()
     except WebSocketDisconnect:
         await manager.disconnect(websocket)
     except Exception:
@@ -6,8 +6,10 @@ let userRole = localStorage.getItem("role") || "viewer"; // set by login control
 
 // ------------- WebSocket connection -------------
 let ws;
+const wsDecoder = new TextDecoder();
 function initWebSocket() {
   ws = new WebSocket("ws://127.0.0.1:8000/ws");
+  ws.binaryType = "arraybuffer"; // server sends JSON as binary frames
 
   ws.onopen = () => {
     console.log("WebSocket connected.");
@@ -15,7 +17,8 @@ function initWebSocket() {
 
   ws.onmessage = (evt) => {
     try {
-      const msg = JSON.parse(evt.data);
+      const text = typeof evt.data === "string" ? evt.data : wsDecoder.decode(evt.data);
+      const msg = JSON.parse(text);
       handleWSMessage(msg);
     } catch (e) {
       console.error("Invalid WS message", e);
@@ -42,11 +45,9 @@ function handleWSMessage(msg) {
       // msg.players = []
       renderPlayers(msg.players);
       break;
-    case "budgets_update":
-      renderBudgets(msg.budgets);
-      break;
-    case "results_update":
-      renderResults(msg.results);
+    case "ping":
+      // server heartbeat; silent clients get disconnected
+      ws.send(JSON.stringify({ type: "pong" }));
       break;
     case "start_bidding":
       showStartBidding(msg);
@@ -57,11 +58,26 @@ function handleWSMessage(msg) {
     case "end_bidding":
       showEndBidding(msg);
       break;
-    case "clear_data":
-      // reload UI fully
-      fetchPlayersOnce();
-      fetchBudgetsOnce();
-      fetchResultsOnce();
+    case "snapshot":
+      // sent once on connect: {players, budgets, results, current_bid|null}
+      renderPlayers(msg.players);
+      renderBudgets(msg.budgets);
+      renderResults(msg.results);
+      if (msg.current_bid) {
+        showStartBidding(msg.current_bid);
+        if (msg.current_bid.team) updateCurrentBid(msg.current_bid);
+      } else {
+        // a resync can land after the round closed; don't leave a stale bid up
+        const cur = document.getElementById("currentBid");
+        if (cur) cur.textContent = `No active bidding`;
+      }
+      break;
+    case "state_snapshot":
+      // msg = {budgets, results, players, event}; event is the action that caused it
+      renderPlayers(msg.players);
+      renderBudgets(msg.budgets);
+      renderResults(msg.results);
+      if (msg.event && msg.event.type === "end_bidding") showEndBidding(msg.event);
       break;
     default:
       console.warn("Unknown WS message type", msg.type);
@@ -163,7 +179,7 @@ function showEndBidding(msg) {
   if (msg.team) text = `${msg.player} sold to ${msg.team} for ₹${msg.highest_bid}`;
   else text = `No bids for ${msg.player}`;
   alert(text);
-  // refresh budgets and results are broadcast separately, but ensure UI updated
+  // budgets and results arrive in the same state_snapshot frame
   // fetchBudgetsOnce(); fetchResultsOnce(); // optional
 }
 